@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8; mode: python -*-
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Load tester replaying Eclipse Marketplace Client sessions.
+
+A session is what a Lab does when the user opens the Marketplace
+wizard: it asks for the catalogs, the markets and categories, the
+featured list, the taxonomy of one category and finally node and
+content of one plugin. Every request carries the query parameters
+described in TGLab.
+
+Sessions are either generated from etc/data.yaml or parsed from access
+logs (uvicorn or Apache style, grouped by client address) and replayed
+with a configurable concurrency and rate. No network is needed: the
+default target is the ASGI app called in-process, with --uvicorn a
+server is started on the loopback interface, and --url points to an
+already running local instance.
+
+Run from the repository root, e.g.:
+  python -m app.loadtest --sessions 200 --concurrency 10 --rate 50
+  python -m app.loadtest --log access.log --uvicorn
+"""
+
+###########
+# Imports #
+###########
+import re
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+import http.client
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from app.main import app, load_data, warm_up, CONFIG, TGLab
+
+# match the request line in access logs, the client address is only
+# taken from where the server puts it, never from a timestamp before it
+REQUEST = r'"GET (?P<path>/marketplace/\S*) HTTP/[\d.]+"'
+LOG_LINES = [
+    # uvicorn, possibly prefixed (docker logs -t, journald), e.g.
+    #   INFO:     10.0.0.1:51234 - "GET /marketplace/api/p?os=linux HTTP/1.1" 200 OK
+    #   INFO:     [::1]:51234 - "GET /marketplace/api/p HTTP/1.1" 200 OK
+    re.compile(r'INFO:\s+(?P<client>\d{1,3}(?:\.\d{1,3}){3}|\[[0-9a-fA-F:]+\]|[0-9a-fA-F:]+):\d+ - ' + REQUEST),
+    # Apache/nginx, address at the start of the line, e.g.
+    #   10.0.0.1 - - [19/May/2017:10:00:00 +0200] "GET /marketplace/api/p HTTP/1.1" 200 512
+    #   2001:db8::1 - - [19/May/2017:10:00:00 +0200] "GET /marketplace/api/p HTTP/1.1" 200 512
+    re.compile(r'^(?P<client>\d{1,3}(?:\.\d{1,3}){3}|\[[0-9a-fA-F:]+\]|[0-9a-fA-F]*:[0-9a-fA-F:]+) [^"]*' + REQUEST),
+]
+
+# client profiles a generated session picks from
+LAB_PROFILES = [
+    {"os": "win32", "ws": "win32"},
+    {"os": "linux", "ws": "gtk"},
+    {"os": "macosx", "ws": "cocoa"},
+]
+LAB_LANGUAGES = ["de_DE", "en_US", "en_GB"]
+LAB_JAVA_VERSIONS = ["1.8.0_292", "11.0.11", "1.6.0_65"]
+LAB_RUNTIME_VERSIONS = ["3.7.0.v20110110", "3.13.0.v20200828-0941"]
+
+###########
+# Objects #
+###########
+class Session():
+    """A list of (path, query string) pairs requested by one client in
+    that order."""
+    def __init__(self, client = "", requests = None):
+        self.client = client
+        self.requests = requests if requests is not None else []
+# class Session ends here
+
+class Report():
+    """Collects latencies and errors per route."""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = None
+        self.finished = None
+
+    def add(self, route, latency, ok):
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+
+    def as_dict(self):
+        """Return the statistics per route and in total, latencies in
+        milliseconds, throughput in requests per second."""
+        elapsed = max((self.finished or 0) - (self.started or 0), 1e-9)
+        routes = {}
+        everything = []
+        for route in sorted(self.latencies):
+            values = self.latencies[route]
+            everything.extend(values)
+            routes[route] = summarize(values, self.errors[route], elapsed)
+        total = summarize(everything, sum(self.errors.values()), elapsed)
+        return {"elapsed": elapsed, "routes": routes, "total": total}
+# class Report ends here
+
+##############
+# Statistics #
+##############
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+def summarize(values, errors, elapsed):
+    values = sorted(values)
+    count = len(values)
+    return {"requests": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "throughput": count / elapsed,
+            "p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000}
+
+def route_name(path):
+    """Return the path template of the route serving path, so that all
+    nodes or taxonomies are reported together."""
+    for route in app.routes:
+        regex = getattr(route, "path_regex", None)
+        if regex is not None and regex.match(path):
+            return route.path
+    return "unmatched"
+
+#####################
+# Building sessions #
+#####################
+def random_lab(rng):
+    profile = rng.choice(LAB_PROFILES)
+    return TGLab(os = profile["os"],
+                 ws = profile["ws"],
+                 nl = rng.choice(LAB_LANGUAGES),
+                 java_version = rng.choice(LAB_JAVA_VERSIONS),
+                 runtime_version = rng.choice(LAB_RUNTIME_VERSIONS))
+
+def generate_sessions(count, seed=None):
+    """Build count sessions following the path the Lab takes through
+    the marketplace, with plugins and categories from the data file."""
+    rng = random.Random(seed)
+    plugins = load_data()
+    market_id = CONFIG['General']['id']
+    categories = list(CONFIG['Categories'].keys())
+    sessions = []
+    for number in range(count):
+        query = urlencode(random_lab(rng).query())
+        category = rng.choice(categories)
+        candidates = [p for p in plugins if p.category == category] or plugins
+        plugin = rng.choice(candidates)
+        paths = ["/marketplace/catalogs/api/p",
+                 "/marketplace/api/p",
+                 "/marketplace/featured/" + market_id + "/api/p",
+                 "/marketplace/taxonomy/term/" + market_id + "," + category + "/api/p",
+                 "/marketplace/node/" + plugin.plugId + "/api/p",
+                 "/marketplace/content/" + plugin.plugId + "/api/p"]
+        sessions.append(Session("generated-%d" % number, [(path, query) for path in paths]))
+    return sessions
+
+def parse_log(lines):
+    """Turn access log lines into sessions. Requests are grouped by
+    client address, a request for the catalogs starts a new session."""
+    sessions = []
+    current = {}
+    for line in lines:
+        match = None
+        for pattern in LOG_LINES:
+            match = pattern.search(line)
+            if match is not None:
+                break
+        if match is None:
+            continue
+        client = match.group("client").strip("[]")
+        path, _, query = match.group("path").partition("?")
+        if path.endswith("/check"):
+            # would hit the update sites on the internet
+            continue
+        if client not in current or path.startswith("/marketplace/catalogs/"):
+            current[client] = Session(client)
+            sessions.append(current[client])
+        current[client].requests.append((path, query))
+    return sessions
+
+###########
+# Targets #
+###########
+class ASGITarget():
+    """Calls the app in-process, without any socket involved."""
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+
+    async def get(self, path, query):
+        scope = {"type": "http",
+                 "asgi": {"version": "3.0"},
+                 "http_version": "1.1",
+                 "method": "GET",
+                 "scheme": "http",
+                 "path": path,
+                 "raw_path": path.encode(),
+                 "root_path": "",
+                 "query_string": query.encode(),
+                 "headers": [(b"host", b"loadtest")],
+                 "client": ("127.0.0.1", 0),
+                 "server": ("loadtest", 80)}
+        sent = False
+        status = None
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await self.app(scope, receive, send)
+        return status
+
+    def close(self):
+        pass
+# class ASGITarget ends here
+
+class HTTPTarget():
+    """Sends requests to a local server, one thread per concurrent
+    session so the blocking client does not serialize them."""
+    def __init__(self, url, concurrency):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _get(self, path, query):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            connection.request("GET", self.prefix + path + ("?" + query if query else ""))
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    async def get(self, path, query):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get, path, query)
+
+    def close(self):
+        self.executor.shutdown()
+# class HTTPTarget ends here
+
+def start_uvicorn(asgi_app):
+    """Start uvicorn in a background thread on a free loopback port.
+    Returns the server (set should_exit to stop it) and its URL."""
+    import uvicorn
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(asgi_app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.01)
+    return server, "http://127.0.0.1:%d" % sock.getsockname()[1]
+
+##########
+# Replay #
+##########
+async def replay(sessions, target, concurrency=1, rate=0):
+    """Replay sessions against target with at most concurrency sessions
+    in flight, starting at most rate sessions per second (0 means no
+    limit). Returns a Report."""
+    report = Report()
+    pending = iter(enumerate(sessions))
+    report.started = time.perf_counter()
+
+    async def worker():
+        for number, session in pending:
+            if rate > 0:
+                delay = report.started + number / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            for path, query in session.requests:
+                start = time.perf_counter()
+                try:
+                    status = await target.get(path, query)
+                    ok = status is not None and status < 400
+                except Exception:
+                    ok = False
+                report.add(route_name(path), time.perf_counter() - start, ok)
+
+    await asyncio.gather(*[worker() for i in range(max(concurrency, 1))])
+    report.finished = time.perf_counter()
+    return report
+
+def format_report(stats):
+    rows = list(stats["routes"].items()) + [("TOTAL", stats["total"])]
+    width = max(len(route) for route, s in rows + [("route", None)])
+    header = "%-*s %8s %7s %9s %9s %9s %9s" % (width, "route", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms")
+    lines = [header, "-" * len(header)]
+    for route, s in rows:
+        lines.append("%-*s %8d %6.1f%% %9.1f %9.2f %9.2f %9.2f" % (
+            width, route, s["requests"], s["error_rate"] * 100, s["throughput"], s["p50"], s["p95"], s["p99"]))
+    lines.append("elapsed: %.2fs" % stats["elapsed"])
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Marketplace Client sessions against the marketplace.")
+    parser.add_argument("--sessions", type=int, default=100, help="number of sessions to generate")
+    parser.add_argument("--log", help="replay sessions from this access log instead of generating them")
+    parser.add_argument("--concurrency", type=int, default=1, help="sessions in flight at the same time")
+    parser.add_argument("--rate", type=float, default=0, help="sessions started per second, 0 for no limit")
+    parser.add_argument("--seed", type=int, help="seed for generating sessions")
+    parser.add_argument("--url", help="base URL of a running local instance, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--uvicorn", action="store_true", help="start uvicorn on the loopback interface")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.log:
+        with open(args.log, 'r', encoding='utf-8', errors='replace') as stream:
+            sessions = parse_log(stream)
+    else:
+        sessions = generate_sessions(args.sessions, args.seed)
+
+    server = None
+    if args.uvicorn:
+        server, url = start_uvicorn(app)
+        target = HTTPTarget(url, args.concurrency)
+    elif args.url:
+        target = HTTPTarget(args.url, args.concurrency)
+    else:
+        # no start-up events in-process, warm up before the clock starts
+        # so that the first sessions do not measure the cold start
+        warm_up()
+        target = ASGITarget(app)
+
+    try:
+        report = asyncio.run(replay(sessions, target, args.concurrency, args.rate))
+    finally:
+        target.close()
+        if server is not None:
+            server.should_exit = True
+
+    stats = report.as_dict()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(format_report(stats))
+    return 1 if stats["total"]["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+#########
+# FINIS #
+#########
@@ -53,10 +53,13 @@ __date__ = "2017-05-19"
 ###########
 # Imports #
 ###########
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import logging
+import threading
 import yaml
-import requests
 from configparser import ConfigParser
 from lxml import etree
 
@@ -64,31 +67,27 @@ from fastapi import FastAPI, Path, Response, HTTPException
 from fastapi.responses import PlainTextResponse, HTMLResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+# requests is only needed for check_urls and imported there
 
 # setting up things
-# both config and cache directory are in the same place as this script
-CONFIG = ConfigParser()
-CONFIG.read('etc/default.conf')
-
-# override config from the general section from environment, for configuration inside docker.
-# environment variables starting with MS_GENERAL_ are mapped, example:
-#   MS_GENERAL_LOGFILE -> CONFIG['General']['logfile']
-env_vars=os.environ
-for key in env_vars:
-  if(key.startswith("MS_GENERAL_")):
-    confkey=key[11:].lower()
-    confval=env_vars[key]
-    CONFIG.set("General", confkey, confval)
-
-LOGFILE = CONFIG['General']['logfile']
-LOGLEVEL = CONFIG['General']['loglevel']
+# both config and data file are in etc/ next to the app directory,
+# independent of the working directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.path.join(BASE_DIR, 'etc', 'default.conf')
+DATA_FILE = os.path.join(BASE_DIR, 'etc', 'data.yaml')
 
-numeric_level = getattr(logging, LOGLEVEL.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError('Invalid log level: %s' % loglevel)
-logging.basicConfig(filename=LOGFILE, level=numeric_level, format='%(asctime)s - %(levelname)s - %(message)s')
+# everything below is filled in by warm_up(), see there
+CONFIG = ConfigParser()
+MPLACE = None
+PLUGIN_LIST = None
+RENDERED = {}
+TIMINGS = {}
+READY = threading.Event()
+WARM_UP_LOCK = threading.Lock()
 
-WIKI_VIEW = CONFIG['General']['wiki_view']
+# default for PlugIn fields taken from the config, so that an empty
+# value in data.yaml (None) stays empty and fails validation
+_FROM_CONFIG = object()
 
 # adaptable XPath for info that is parsed out of the confluence page
 # was /pluginInfo/table/
@@ -100,18 +99,38 @@ HEADERLINE = 'Content-Type: text/%s; charset=utf-8\n'
 # Objects #
 ###########
 class TGLab():
-    """Class for storing information about the Lab that sent the query.
-    # We should maybe catch and retain all those things the client tells us:
-    # product=info.textgrid.lab.core.application.base_product
-    # os=macosx
-    # runtime.version=3.7.0.v20110110
-    # client=org.eclipse.epp.mpc.core
-    # java.version=1.6.0_65
-    # product.version=0.0.2.201310011243
-    # ws=cocoa
-    # nl=de_DE
-"""
-    pass
+    """Class for storing information about the Lab that sent the query,
+    i.e. all those things the Marketplace Client tells us with every
+    request (see the query example in the module docstring)."""
+    def __init__(self,
+                 product = "info.textgrid.lab.core.application.base_product",
+                 os = "macosx",
+                 runtime_version = "3.7.0.v20110110",
+                 client = "org.eclipse.epp.mpc.core",
+                 java_version = "1.6.0_65",
+                 product_version = "0.0.2.201310011243",
+                 ws = "cocoa",
+                 nl = "de_DE"):
+        self.product = product
+        self.os = os
+        self.runtime_version = runtime_version
+        self.client = client
+        self.java_version = java_version
+        self.product_version = product_version
+        self.ws = ws
+        self.nl = nl
+
+    def query(self):
+        """Return the parameters in the order and with the names the
+        client uses in its query string."""
+        return [("product", self.product),
+                ("os", self.os),
+                ("runtime.version", self.runtime_version),
+                ("client", self.client),
+                ("java.version", self.java_version),
+                ("product.version", self.product_version),
+                ("ws", self.ws),
+                ("nl", self.nl)]
 # class TGLab ends here
 
 class PlugIn():
@@ -129,10 +148,10 @@ class PlugIn():
                  category = "",
                  installableUnit = "",
                  screenshot = "",
-                 owner = CONFIG['General']['company'],
-                 company = CONFIG['General']['company'],
-                 company_url = CONFIG['General']['company_url'],
-                 update_url = CONFIG['General']['update_url']):
+                 owner = _FROM_CONFIG,
+                 company = _FROM_CONFIG,
+                 company_url = _FROM_CONFIG,
+                 update_url = _FROM_CONFIG):
         self.human_title = human_title
         self.description = description
         self.logo = logo
@@ -144,10 +163,11 @@ class PlugIn():
         self.pageId = str(pageId)
         self.screenshot = screenshot
         self.installableUnit = installableUnit
-        self.owner = owner
-        self.company = company
-        self.company_url = company_url
-        self.update_url = update_url
+        # defaults come from the config, which is only read at warm-up
+        self.owner = owner if owner is not _FROM_CONFIG else CONFIG['General']['company']
+        self.company = company if company is not _FROM_CONFIG else CONFIG['General']['company']
+        self.company_url = company_url if company_url is not _FROM_CONFIG else CONFIG['General']['company_url']
+        self.update_url = update_url if update_url is not _FROM_CONFIG else CONFIG['General']['update_url']
 # class PlugIn ends here
 
 class MarketPlace():
@@ -165,18 +185,49 @@ class MarketPlace():
         self.main_wiki_page = main_wiki_page
 # class MarketPlace ends here
 
-# create Marketplace object
-MPLACE = MarketPlace(
-    CONFIG['General']['human_title'],
-    CONFIG['General']['description'],
-    CONFIG['General']['id'],
-    CONFIG['General']['name'],
-    CONFIG['General']['url'],
-    CONFIG['General']['icon'],
-    CONFIG['General']['company'],
-    CONFIG['General']['company_url'],
-    CONFIG['General']['update_url'],
-    CONFIG['General']['main_wiki_page'])
+#################
+# Configuration #
+#################
+def load_config():
+    """Read the config file, only once."""
+    if CONFIG.has_section('General'):
+        return CONFIG
+    CONFIG.read(CONFIG_FILE)
+
+    # override config from the general section from environment, for configuration inside docker.
+    # environment variables starting with MS_GENERAL_ are mapped, example:
+    #   MS_GENERAL_LOGFILE -> CONFIG['General']['logfile']
+    env_vars=os.environ
+    for key in env_vars:
+      if(key.startswith("MS_GENERAL_")):
+        confkey=key[11:].lower()
+        confval=env_vars[key]
+        CONFIG.set("General", confkey, confval)
+    return CONFIG
+
+def setup_logging():
+    # a relative logfile is resolved against the repository, like config and data file
+    LOGFILE = os.path.join(BASE_DIR, CONFIG['General']['logfile'])
+    LOGLEVEL = CONFIG['General']['loglevel']
+
+    numeric_level = getattr(logging, LOGLEVEL.upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError('Invalid log level: %s' % LOGLEVEL)
+    logging.basicConfig(filename=LOGFILE, level=numeric_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def build_marketplace():
+    """Create the Marketplace object from the config."""
+    return MarketPlace(
+        CONFIG['General']['human_title'],
+        CONFIG['General']['description'],
+        CONFIG['General']['id'],
+        CONFIG['General']['name'],
+        CONFIG['General']['url'],
+        CONFIG['General']['icon'],
+        CONFIG['General']['company'],
+        CONFIG['General']['company_url'],
+        CONFIG['General']['update_url'],
+        CONFIG['General']['main_wiki_page'])
 
 ################
 # YAML parsing #
@@ -188,10 +239,26 @@ def plugin_constructor(loader, node):
 yaml.SafeLoader.add_constructor('!PlugIn', plugin_constructor)
 
 def load_data():
-    with open('etc/data.yaml', 'r', encoding='utf-8') as stream:
+    load_config()
+    with open(DATA_FILE, 'r', encoding='utf-8') as stream:
         PLUGINS = yaml.safe_load(stream)
     return PLUGINS
 
+def validate_data(PLUGINS):
+    """Check the required fields (see README), unique plugin ids and
+    known categories. Raises ValueError on the first problem."""
+    required = ['name', 'installableUnit', 'update_url', 'human_title', 'description', 'license']
+    ids_found = set()
+    for plugin in PLUGINS:
+        missing = [field for field in required if not getattr(plugin, field)]
+        if missing:
+            raise ValueError('Plugin %s is missing %s' % (plugin.plugId, ', '.join(missing)))
+        if plugin.plugId in ids_found:
+            raise ValueError('Duplicate plugin id: %s' % plugin.plugId)
+        ids_found.add(plugin.plugId)
+        if plugin.category not in CONFIG['Categories']:
+            raise ValueError('Plugin %s has unknown category %s' % (plugin.plugId, plugin.category))
+
 #############################################
 # Here starts the building of the XML nodes #
 #############################################
@@ -352,7 +419,7 @@ def build_mp_node_apip(plug_id, PLUGINS):
     return node
 # def build_mp_node_apip ends here
 
-def build_mp_frfp_apip(list_type, PLUGINS, mark_id=CONFIG['General']['id']):
+def build_mp_frfp_apip(list_type, PLUGINS, mark_id=None):
     """Take those nodes (my theory here) that have a value of non-nil in
     'featured' (should be on the wiki page) and wraps them into some
     XML. Works also for recent, favorite and popular, they are
@@ -396,9 +463,58 @@ def build_mp_content_apip(plug_id, PLUGINS):
 ##########
 # Output #
 ##########
+def render(node):
+    return etree.tostring(node, pretty_print=True, encoding='utf-8', xml_declaration=True)
+
 def xmlresponse(node):
-    xml = etree.tostring(node, pretty_print=True, encoding='utf-8', xml_declaration=True)
-    return Response(content=xml, media_type='application/xml')
+    return Response(content=render(node), media_type='application/xml')
+
+def cachedresponse(key):
+    """Return one of the responses rendered at warm-up."""
+    return Response(content=RENDERED[key], media_type='application/xml')
+
+###########
+# Warm-up #
+###########
+def timed(phase, function, *args):
+    """Call function and note how long it took in TIMINGS."""
+    started = time.perf_counter()
+    result = function(*args)
+    TIMINGS[phase] = time.perf_counter() - started
+    return result
+
+def prerender():
+    """Render the responses every Lab asks for when opening the
+    Marketplace, they do not change until the next start."""
+    RENDERED['catalogs'] = render(build_mp_cat_apip())
+    RENDERED['api'] = render(build_mp_apip())
+    RENDERED['featured'] = render(build_mp_frfp_apip('featured', PLUGIN_LIST))
+
+def warm_up():
+    """Load and check config and plugin data, set up logging and
+    pre-render the hot responses, timing every phase. Called at
+    start-up; routes call it too in case the app is used without
+    start-up events, only the first call does the work. Raises
+    ValueError if config or data are broken, so a broken container
+    never becomes ready."""
+    global MPLACE, PLUGIN_LIST
+    if READY.is_set():
+        return
+    with WARM_UP_LOCK:
+        if READY.is_set():
+            return
+        started = time.perf_counter()
+        timed('config', load_config)
+        timed('logging', setup_logging)
+        MPLACE = timed('marketplace', build_marketplace)
+        plugins = timed('data', load_data)
+        timed('validate', validate_data, plugins)
+        PLUGIN_LIST = plugins
+        timed('prerender', prerender)
+        TIMINGS['warm_up'] = time.perf_counter() - started
+        for phase, seconds in TIMINGS.items():
+            logging.info('Start-up phase %s took %.1f ms', phase, seconds * 1000)
+        READY.set()
 
 
 ##########
@@ -436,8 +552,8 @@ xmlresponsedef = {
   responses=xmlresponsedef
 )
 def main_api_p():
-    node = build_mp_apip()
-    return xmlresponse(node)
+    warm_up()
+    return cachedresponse('api')
 
 
 @app.get("/marketplace/catalogs/api/p",
@@ -449,8 +565,8 @@ def main_api_p():
   responses=xmlresponsedef
 )
 def catalogs_api_p():
-    node = build_mp_cat_apip()
-    return xmlresponse(node)
+    warm_up()
+    return cachedresponse('catalogs')
 
 
 @app.get("/marketplace/taxonomy/term/{market_id},{category_id}/api/p",
@@ -460,8 +576,8 @@ def catalogs_api_p():
 def taxonomy_term_api_p(
   market_id = Path(..., example="tg01"),
   category_id = Path(..., example="stable")):
-    PLUGINS = load_data()
-    node = build_mp_taxonomy(market_id, category_id, PLUGINS)
+    warm_up()
+    node = build_mp_taxonomy(market_id, category_id, PLUGIN_LIST)
     return xmlresponse(node)
 
 
@@ -470,8 +586,8 @@ def taxonomy_term_api_p(
   response_class=Response,
   responses=xmlresponsedef)
 def show_node_api_p(plugin_id = Path(..., example="1")):
-    PLUGINS = load_data()
-    node = build_mp_content_apip(plugin_id, PLUGINS)
+    warm_up()
+    node = build_mp_content_apip(plugin_id, PLUGIN_LIST)
     return xmlresponse(node)
 
 
@@ -480,8 +596,8 @@ def show_node_api_p(plugin_id = Path(..., example="1")):
   response_class=Response,
   responses=xmlresponsedef)
 def show_content_api_p(plugin_id = Path(..., example="1")):
-    PLUGINS = load_data()
-    node = build_mp_content_apip(plugin_id, PLUGINS)
+    warm_up()
+    node = build_mp_content_apip(plugin_id, PLUGIN_LIST)
     return xmlresponse(node)
 
 
@@ -490,8 +606,10 @@ def show_content_api_p(plugin_id = Path(..., example="1")):
   response_class=Response,
   responses=xmlresponsedef)
 def list_type_api_p(ltype = Path(..., example="featured")):
-    PLUGINS = load_data()
-    node = build_mp_frfp_apip(ltype, PLUGINS)
+    warm_up()
+    if ltype == 'featured':
+        return cachedresponse('featured')
+    node = build_mp_frfp_apip(ltype, PLUGIN_LIST)
     return xmlresponse(node)
 
 
@@ -502,8 +620,10 @@ def list_type_api_p(ltype = Path(..., example="featured")):
 def list_type_market_api_p(
   ltype = Path(..., example="featured"), 
   market_id = Path(..., example="tg01")):
-    PLUGINS = load_data()
-    node = build_mp_frfp_apip(ltype, PLUGINS, market_id)
+    warm_up()
+    if ltype == 'featured':
+        return cachedresponse('featured')
+    node = build_mp_frfp_apip(ltype, PLUGIN_LIST, market_id)
     return xmlresponse(node)
 
 
@@ -517,6 +637,7 @@ def list_type_market_api_p(
   })
 def check_urls():
     """Check all update site URLs from data.yaml, return 500 in case of failures."""
+    import requests
     PLUGINS = load_data()
     urls = set() # a set, so we check every url only once
     broken = set()
@@ -533,6 +654,27 @@ def check_urls():
         return "All update site URLS ok"
 
 
+@app.get("/marketplace/ready",
+  summary="Readiness",
+  responses={
+    200: { "description": "Warm-up finished, with the time each start-up phase took in ms" },
+    503: { "description": "Still warming up" },
+  })
+def ready():
+    """Report whether the warm-up is done, e.g. for container readiness probes."""
+    if not READY.is_set():
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {
+      "ready": True,
+      "timings": {phase: round(seconds * 1000, 1) for phase, seconds in TIMINGS.items()}
+    }
+
+
+@app.on_event("startup")
+def startup():
+    warm_up()
+
+
 ######################
 # exception handlers #
 ######################
@@ -562,6 +704,8 @@ async def validation_exception_handler(request, exc):
   """Return plaintext for validation errors"""
   return PlainTextResponse(str(exc), status_code=422)
 
+TIMINGS['import'] = time.perf_counter() - IMPORT_STARTED
+
 #########
 # FINIS #
 #########
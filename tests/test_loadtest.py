@@ -0,0 +1,52 @@
+import asyncio
+
+from app.main import app
+from app.loadtest import generate_sessions, parse_log, replay, route_name, format_report, ASGITarget
+
+def test_generated_session_shape():
+    sessions = generate_sessions(5, seed=1)
+    assert len(sessions) == 5
+    for session in sessions:
+        routes = [route_name(path) for path, query in session.requests]
+        assert routes == ['/marketplace/catalogs/api/p',
+                          '/marketplace/api/p',
+                          '/marketplace/{ltype}/{market_id}/api/p',
+                          '/marketplace/taxonomy/term/{market_id},{category_id}/api/p',
+                          '/marketplace/node/{plugin_id}/api/p',
+                          '/marketplace/content/{plugin_id}/api/p']
+        for path, query in session.requests:
+            assert 'runtime.version=' in query
+            assert 'client=org.eclipse.epp.mpc.core' in query
+
+def test_parse_log():
+    lines = [
+        'INFO:     10.0.0.1:51234 - "GET /marketplace/catalogs/api/p?os=linux HTTP/1.1" 200 OK',
+        '10.0.0.2 - - [19/May/2017:10:00:00 +0200] "GET /marketplace/catalogs/api/p HTTP/1.1" 200 512',
+        'INFO:     10.0.0.1:51234 - "GET /marketplace/api/p?os=linux HTTP/1.1" 200 OK',
+        'INFO:     10.0.0.1:51234 - "GET /marketplace/check HTTP/1.1" 200 OK',
+        'some unrelated line',
+        'INFO:     10.0.0.1:51240 - "GET /marketplace/catalogs/api/p HTTP/1.1" 200 OK',
+        '2021-05-19T10:00:00.123Z INFO:     10.0.0.3:51234 - "GET /marketplace/catalogs/api/p HTTP/1.1" 200 OK',
+        '2021-05-19T10:00:01.456Z INFO:     [::1]:51234 - "GET /marketplace/catalogs/api/p HTTP/1.1" 200 OK',
+        '2001:db8::1 - - [19/May/2017:10:00:00 +0200] "GET /marketplace/api/p HTTP/1.1" 200 512',
+    ]
+    sessions = parse_log(lines)
+    assert [s.client for s in sessions] == ['10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.3', '::1', '2001:db8::1']
+    assert sessions[0].requests == [('/marketplace/catalogs/api/p', 'os=linux'),
+                                    ('/marketplace/api/p', 'os=linux')]
+
+def test_replay_in_process():
+    sessions = generate_sessions(4, seed=2)
+    sessions.append(parse_log(['1.2.3.4 "GET /marketplace/nopage HTTP/1.1"'])[0])
+    report = asyncio.run(replay(sessions, ASGITarget(app), concurrency=2)).as_dict()
+    assert report['total']['requests'] == 25
+    assert report['total']['errors'] == 1
+    assert report['routes']['unmatched']['error_rate'] == 1.0
+    assert report['routes']['/marketplace/api/p']['errors'] == 0
+    assert report['routes']['/marketplace/api/p']['p50'] <= report['routes']['/marketplace/api/p']['p99']
+
+def test_format_report_columns():
+    report = asyncio.run(replay(generate_sessions(1, seed=3), ASGITarget(app))).as_dict()
+    lines = format_report(report).splitlines()
+    table = lines[:1] + lines[2:-1]
+    assert len(set(len(line) for line in table)) == 1
@@ -1,4 +1,6 @@
-from app.main import load_data
+from starlette.testclient import TestClient
+
+from app.main import app, load_data
 
 def test_main_api_p(test_app):
     response = test_app.get('/marketplace/api/p')
@@ -84,4 +86,12 @@ def test_check_urls_404(test_app, requests_mock):
         )
 
     response = test_app.get('/marketplace/check')
-    assert response.status_code == 500
\ No newline at end of file
+    assert response.status_code == 500
+
+def test_ready():
+    with TestClient(app) as client:  # runs the start-up warm-up
+        response = client.get('/marketplace/ready')
+    assert response.status_code == 200
+    timings = response.json()['timings']
+    for phase in ['import', 'config', 'data', 'validate', 'prerender', 'warm_up']:
+        assert phase in timings
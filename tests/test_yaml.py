@@ -1,4 +1,7 @@
-from app.main import load_data
+import pytest
+import yaml
+
+from app.main import load_config, load_data, validate_data
 
 from pprint import pprint
 
@@ -13,3 +16,29 @@ def test_unique_plugin_ids():
     ids_found.add(plugin.plugId)
 
 
+
+def test_data_valid():
+  validate_data(load_data())
+
+def test_duplicate_plugin_id_invalid():
+  plugins = load_data()
+  with pytest.raises(ValueError):
+    validate_data(plugins + plugins[:1])
+
+def test_empty_update_url_invalid():
+  load_config()
+  plugins = yaml.safe_load("""
+- !PlugIn
+  plugId: 99
+  name: empty
+  category: 4
+  pageId: 1
+  installableUnit: some.feature.group
+  update_url:
+  human_title: Empty update site
+  description: no update site
+  license: LGPL
+""")
+  assert plugins[0].update_url is None
+  with pytest.raises(ValueError):
+    validate_data(plugins)